@@ -1,3 +1,5 @@
 from .chunk import Chunk
 from .region import Region
-from .empty_region import EmptyRegion
\ No newline at end of file
+from .empty_region import EmptyRegion
+from .raw_chunk import RawChunk
+from .scan import ChunkSummary, quick_scan
\ No newline at end of file
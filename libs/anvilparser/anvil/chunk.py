@@ -53,16 +53,19 @@ class Chunk:
     __slots__ = ('version', 'data', 'x', 'z', 'tile_entities')
 
     def __init__(self, nbt_data: nbt.NBTFile):
-        self.version : int = nbt_data['DataVersion'].value
+        # Bound to locals rather than read back from the attributes for each lookup
+        version : int = nbt_data['DataVersion'].value
+        self.version = version
 
-        if self.version < _VERSION_21w43a:
-            self.data = nbt_data['Level']
-            self.tile_entities = self.data['TileEntities']
+        if version < _VERSION_21w43a:
+            data = nbt_data['Level']
+            self.tile_entities = data['TileEntities']
         else:
-            self.data = nbt_data
-            self.tile_entities = self.data['block_entities']
-        self.x = self.data['xPos'].value
-        self.z = self.data['zPos'].value
+            data = nbt_data
+            self.tile_entities = data['block_entities']
+        self.data = data
+        self.x = data['xPos'].value
+        self.z = data['zPos'].value
 
     @classmethod
     def from_region(cls, region: (str | Region), chunk_x: int, chunk_z: int):
@@ -0,0 +1,5 @@
+try:
+    # ISA-L is a lot faster than zlib, and exposes the same interface
+    from isal import isal_zlib as zlib
+except ImportError:
+    import zlib
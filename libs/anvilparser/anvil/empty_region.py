@@ -1,9 +1,10 @@
 from typing import List, BinaryIO
 from .empty_chunk import EmptyChunk
-from .chunk import Chunk
+from .chunk import Chunk, _VERSION_21w43a
+from .raw_chunk import RawChunk
 from io import BytesIO
 from nbt import nbt
-import zlib
+from .compression import zlib
 import math
 
 def from_inclusive(a, b):
@@ -17,7 +18,7 @@ class EmptyRegion:
     
     Attributes
     ----------
-    chunks: List[:class:`anvil.EmptyChunk`]
+    chunks: List[:class:`anvil.EmptyChunk` | :class:`anvil.RawChunk`]
         List of chunks in this region
     x: :class:`int`
     z: :class:`int`
@@ -25,7 +26,7 @@ class EmptyRegion:
     __slots__ = ('chunks', 'x', 'z')
     def __init__(self, x: int, z: int):
         # Create a 1d list for the 32x32 chunks
-        self.chunks: List[EmptyChunk] = [None] * 1024
+        self.chunks: List[EmptyChunk|RawChunk] = [None] * 1024
         self.x = x
         self.z = z
 
@@ -63,6 +64,23 @@ class EmptyRegion:
         """
         self.chunks[chunk.z % 32 * 32 + chunk.x % 32] = chunk
 
+    def add_raw_chunk(self, x: int, z: int, data: bytes, compression: int = 2):
+        """
+        Adds already compressed chunk data to this region,
+        it will be saved as is, without being encoded again.
+        Will overwrite if a chunk already exists in this location
+
+        Parameters
+        ----------
+        int x, z
+            Chunk's coordinates
+        data
+            Chunk's compressed NBT data, as returned by :meth:`anvil.Region.raw_chunk_bytes`
+        compression
+            Compression type of ``data``
+        """
+        self.add_chunk(RawChunk(x, z, data, compression))
+
     def save(self, file: (str|BinaryIO|None)=None) -> bytes:
         """
         Returns the region as bytes with
@@ -75,23 +93,31 @@ class EmptyRegion:
             Either a path or a file object, if given region
             will be saved there.
         """
-        # Store all the chunks data as zlib compressed nbt data
+        # Store all the chunks data as compressed nbt data, along with its compression type
         chunks_data = []
         for chunk in self.chunks:
             if chunk is None:
                 chunks_data.append(None)
                 continue
+            if isinstance(chunk, RawChunk):
+                # Already compressed, copy it as is
+                chunks_data.append((chunk.compression, chunk.data))
+                continue
             chunk_data = BytesIO()
             if isinstance(chunk, Chunk):
-                nbt_data = nbt.NBTFile()
-                nbt_data.tags.append(nbt.TAG_Int(name='DataVersion', value=chunk.version))
-                nbt_data.tags.append(chunk.data)
+                if chunk.version >= _VERSION_21w43a:
+                    # Since "Level" was removed, the data is the whole chunk
+                    nbt_data = chunk.data
+                else:
+                    nbt_data = nbt.NBTFile()
+                    nbt_data.tags.append(nbt.TAG_Int(name='DataVersion', value=chunk.version))
+                    nbt_data.tags.append(chunk.data)
             else:
                 nbt_data = chunk.save()
             nbt_data.write_file(buffer=chunk_data)
             chunk_data.seek(0)
             chunk_data = zlib.compress(chunk_data.read())
-            chunks_data.append(chunk_data)
+            chunks_data.append((2, chunk_data))
 
         # This is what is added after the location and timestamp header
         chunks_bytes = bytes()
@@ -100,8 +126,9 @@ class EmptyRegion:
             if chunk is None:
                 offsets.append(None)
                 continue
-            # 4 bytes are for length, b'\x02' is the compression type which is 2 since its using zlib
-            to_add = (len(chunk)+1).to_bytes(4, 'big') + b'\x02' + chunk
+            compression, chunk = chunk
+            # 4 bytes are for length, followed by the compression type which is 2 when using zlib
+            to_add = (len(chunk)+1).to_bytes(4, 'big') + compression.to_bytes(1, 'big') + chunk
 
             # offset in 4KiB sectors
             sector_offset = len(chunks_bytes) // 4096
@@ -0,0 +1,22 @@
+class RawChunk:
+    """
+    Chunk kept exactly as it is stored in a region file,
+    used to copy chunks between regions without parsing them again
+
+    Attributes
+    ----------
+    x: :class:`int`
+        Chunk's X position
+    z: :class:`int`
+        Chunk's Z position
+    data: :class:`bytes`
+        Chunk's NBT data, compressed
+    compression: :class:`int`
+        Compression type of ``data``, 1 for gzip, 2 for zlib and 3 for uncompressed
+    """
+    __slots__ = ('x', 'z', 'data', 'compression')
+    def __init__(self, x: int, z: int, data: bytes, compression: int = 2):
+        self.x = x
+        self.z = z
+        self.data = data
+        self.compression = compression
@@ -1,23 +1,35 @@
-from typing import Tuple, Union, BinaryIO
+from typing import Iterator, Tuple, Union, BinaryIO
+from itertools import compress
 from nbt import nbt
-import zlib
+import mmap
+import struct
+from .compression import zlib
 from io import BytesIO
 import anvil
 from .errors import GZipChunkData
 
+# A chunk's entry in the locations header, 3 bytes of offset and 1 byte of length
+_LOCATION = struct.Struct('>I')
+# The whole locations header, one entry per chunk
+_LOCATIONS = struct.Struct('>1024I')
+
 class Region:
     """
     Read-only region
 
+    Can be used as a context manager, which closes it on exit
+
     Attributes
     ----------
-    data: :class:`bytes`
-        Region file (``.mca``) as bytes
+    data: :class:`bytes` | :class:`mmap.mmap`
+        Region file (``.mca``) as bytes, or memory-mapped when opened from a path
     """
-    __slots__ = ('data',)
+    __slots__ = ('data', '_inflated_size')
     def __init__(self, data: bytes):
         """Makes a Region object from data, which is the region file content"""
         self.data = data
+        # Size of the largest decompressed chunk so far
+        self._inflated_size: int = zlib.DEF_BUF_SIZE
 
     @staticmethod
     def header_offset(chunk_x: int, chunk_z: int) -> int:
@@ -52,6 +64,59 @@ class Region:
         sectors = self.data[b_off + 3]
         return (off, sectors)
 
+    def sector_offset(self, chunk_x: int, chunk_z: int) -> int:
+        """
+        Returns the chunk offset in the 4KiB sectors from the start of the file,
+        read straight from the header
+
+        Will return ``0`` if chunk hasn't been generated yet
+
+        Parameters
+        ----------
+        chunk_x
+            Chunk's X value
+        chunk_z
+            Chunk's Z value
+        """
+        return _LOCATION.unpack_from(self.data, self.header_offset(chunk_x, chunk_z))[0] >> 8
+
+    def locations(self) -> Tuple[int, ...]:
+        """
+        Returns every entry of the locations header at once
+
+        The entry of a chunk is at index ``chunk_x + chunk_z * 32``,
+        its sector offset is ``entry >> 8`` and its length in sectors is ``entry & 0xFF``.
+        An entry is ``0`` if the chunk hasn't been generated yet
+        """
+        return _LOCATIONS.unpack_from(self.data)
+
+    def _raw_chunk_at(self, sector_offset: int) -> Tuple[bytes, int]:
+        """Returns the compressed NBT data and compression type of the chunk stored at the given sector"""
+        off = sector_offset * 4096
+        length = int.from_bytes(self.data[off:off + 4], byteorder='big')
+        compression = self.data[off + 4] # 2 most of the time
+        return (self.data[off + 5 : off + 5 + length - 1], compression)
+
+    def raw_chunk_bytes(self, chunk_x: int, chunk_z: int) -> (Tuple[bytes, int]|None):
+        """
+        Returns the chunk's compressed NBT data as it is stored in the region,
+        along with its compression type
+
+        Will return ``None`` if chunk hasn't been generated yet
+
+        Parameters
+        ----------
+        chunk_x
+            Chunk's X value
+        chunk_z
+            Chunk's Z value
+        """
+        sector_offset = self.sector_offset(chunk_x, chunk_z)
+        # 0 means it hasn't generated yet, aka it doesn't exist yet
+        if sector_offset == 0:
+            return
+        return self._raw_chunk_at(sector_offset)
+
     def chunk_data(self, chunk_x: int, chunk_z: int) -> (nbt.NBTFile|None):
         """
         Returns the NBT data for a chunk
@@ -68,17 +133,50 @@ class Region:
         anvil.GZipChunkData
             If the chunk's compression is gzip
         """
-        off = self.chunk_location(chunk_x, chunk_z)
-        # (0, 0) means it hasn't generated yet, aka it doesn't exist yet
-        if off == (0, 0):
+        raw = self.raw_chunk_bytes(chunk_x, chunk_z)
+        if raw is None:
             return
-        off = off[0] * 4096
-        length = int.from_bytes(self.data[off:off + 4], byteorder='big')
-        compression = self.data[off + 4] # 2 most of the time
+        compressed_data, compression = raw
         if compression == 1:
             raise GZipChunkData('GZip is not supported')
-        compressed_data = self.data[off + 5 : off + 5 + length - 1]
-        return nbt.NBTFile(buffer=BytesIO(zlib.decompress(compressed_data)))
+        # Chunks of a region are about the same size, so starting with a buffer
+        # as big as the largest one so far avoids growing it while decompressing
+        data = zlib.decompress(compressed_data, bufsize=self._inflated_size)
+        if len(data) > self._inflated_size:
+            self._inflated_size = len(data)
+        return nbt.NBTFile(buffer=BytesIO(data))
+
+    def raw_chunk_iter(self, locations: (Tuple[int, ...]|None) = None) -> Iterator[Tuple[int, int, bytes, int]]:
+        """
+        Iterates over the chunks that have been generated in this region,
+        in the order they are stored in the file, without decompressing them
+
+        Parameters
+        ----------
+        locations
+            Entries of the locations header, as returned by :meth:`locations`,
+            read from the region if not given
+
+        Yields
+        ------
+        Tuple[int, int, bytes, int]
+            Chunk's X value, Z value, compressed NBT data and compression type
+
+        See Also
+        --------
+        anvil.quick_scan : Read the values that tell if a chunk is used
+        """
+        if locations is None:
+            locations = self.locations()
+        # The header is read at once, and only the entries of generated chunks are visited.
+        # Minecraft allocates sectors as chunks get saved, so the order of the header has nothing to do with the file's,
+        # sorting the entries (offset first, then length) reads the file front to back
+        for index in sorted(compress(range(1024), locations), key=locations.__getitem__):
+            sector_offset = locations[index] >> 8
+            if sector_offset == 0:
+                continue
+            data, compression = self._raw_chunk_at(sector_offset)
+            yield index & 31, index >> 5, data, compression
 
     def get_chunk(self, chunk_x: int, chunk_z: int) -> 'anvil.Chunk':
         """
@@ -97,11 +195,29 @@ class Region:
         """
         return anvil.Chunk.from_region(self, chunk_x, chunk_z)
 
+    def close(self):
+        """
+        Releases the memory-mapped file, if any
+
+        The region can't be read from anymore afterwards
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self) -> 'Region':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     @classmethod
     def from_file(cls, file: Union[str, BinaryIO]):
         """
         Creates a new region with the data from reading the given file
 
+        A file given by path is memory-mapped instead of being read,
+        so only the parts of it that are accessed get loaded
+
         Parameters
         ----------
         file
@@ -109,6 +225,13 @@ class Region:
         """
         if isinstance(file, str):
             with open(file, 'rb') as f:
-                return cls(data=f.read())
+                try:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError: # Empty files can't be mapped
+                    return cls(data=f.read())
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    # raw_chunk_iter reads the chunks in the order they are stored, so the OS can read ahead
+                    data.madvise(mmap.MADV_SEQUENTIAL)
+                return cls(data=data)
         else:
             return cls(data=file.read())
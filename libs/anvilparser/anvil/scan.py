@@ -0,0 +1,217 @@
+import struct
+# Not isal: its decompressobj inflates the whole stream whatever max_length is, which defeats stopping early
+import zlib
+from nbt.nbt import (
+    MalformedFileError, TAG_END, TAG_BYTE, TAG_SHORT, TAG_INT, TAG_LONG, TAG_FLOAT, TAG_DOUBLE,
+    TAG_BYTE_ARRAY, TAG_STRING, TAG_LIST, TAG_COMPOUND, TAG_INT_ARRAY, TAG_LONG_ARRAY
+)
+from .errors import GZipChunkData
+
+# Payload size of the tags that have a fixed size, by tag id
+_TAG_SIZES = {TAG_BYTE: 1, TAG_SHORT: 2, TAG_INT: 4, TAG_LONG: 8, TAG_FLOAT: 4, TAG_DOUBLE: 8}
+# Size of a single element of the array tags, by tag id
+_ARRAY_ITEM_SIZES = {TAG_BYTE_ARRAY: 1, TAG_INT_ARRAY: 4, TAG_LONG_ARRAY: 8}
+
+_UBYTE = struct.Struct('>B')
+_USHORT = struct.Struct('>H')
+_INT = struct.Struct('>i')
+_LONG = struct.Struct('>q')
+
+# How many bytes are inflated at once
+_INFLATE_SIZE = 4096
+
+# Flags for the fields found so far
+_FOUND_INHABITED_TIME = 1
+_FOUND_STATUS = 2
+_FOUND_BIOMES = 4
+# Fields that tell if a chunk has been used, depending on its layout
+_NEEDED_IN_LEVEL = _FOUND_INHABITED_TIME | _FOUND_BIOMES
+_NEEDED_IN_ROOT = _FOUND_INHABITED_TIME | _FOUND_STATUS
+
+class ChunkSummary:
+    """
+    The few values of a chunk that tell if it has been used
+
+    Only the values used by the chunk's layout are always read,
+    the others are left as they are once those have been found
+
+    Attributes
+    ----------
+    has_level: :class:`bool`
+        Whether the chunk's data is inside a "Level" compound, which is only the case before 21w43a
+    data_version: :class:`int` | ``None``
+        Chunk's DataVersion, ``None`` if the scan was over before reaching it
+    inhabited_time: :class:`int`
+        How long players have been in the chunk, 0 if it is missing
+    status: :class:`str` | ``None``
+        Chunk's generation status, ``None`` if it is missing, only used without "Level"
+    has_biomes: :class:`bool`
+        Whether the chunk has a "Biomes" tag, only used with "Level"
+    """
+    __slots__ = ('has_level', 'data_version', 'inhabited_time', 'status', 'has_biomes')
+    def __init__(self):
+        self.has_level = False
+        self.data_version: int|None = None
+        self.inhabited_time = 0
+        self.status: str|None = None
+        self.has_biomes = False
+
+class _Reader:
+    """Reads an NBT stream, inflating it only as far as it is read"""
+    __slots__ = ('buffer', 'pos', 'decompressor', 'tail')
+    def __init__(self, data: bytes, compressed: bool):
+        if compressed:
+            self.decompressor = zlib.decompressobj()
+            self.buffer = b''
+            self.tail = data
+        else:
+            self.decompressor = None
+            self.buffer = data
+            self.tail = b''
+        self.pos = 0
+
+    def _inflate(self) -> bytes:
+        """Returns the next inflated bytes of the stream"""
+        if self.decompressor is not None:
+            while not self.decompressor.eof:
+                data = self.decompressor.decompress(self.tail, _INFLATE_SIZE)
+                self.tail = self.decompressor.unconsumed_tail
+                if data:
+                    return data
+                if not self.tail:
+                    break
+        raise MalformedFileError('Chunk data ends unexpectedly')
+
+    def read(self, size: int) -> bytes:
+        if self.pos + size > len(self.buffer):
+            buffer = self.buffer[self.pos:]
+            while len(buffer) < size:
+                buffer += self._inflate()
+            self.buffer = buffer
+            self.pos = 0
+        start = self.pos
+        self.pos += size
+        return self.buffer[start:self.pos]
+
+    def unpack(self, fmt: struct.Struct) -> int:
+        return fmt.unpack(self.read(fmt.size))[0]
+
+    def skip(self, size: int):
+        if size < 0:
+            raise MalformedFileError('Negative tag length')
+        available = len(self.buffer) - self.pos
+        # Inflated data that is skipped over is never kept around
+        while size > available:
+            size -= available
+            self.buffer = self._inflate()
+            self.pos = 0
+            available = len(self.buffer)
+        self.pos += size
+
+class _Scanner:
+    """Walks a chunk's NBT stream, only decoding the tags of a :class:`ChunkSummary`"""
+    __slots__ = ('reader', 'summary', 'found')
+    def __init__(self, reader: _Reader):
+        self.reader = reader
+        self.summary = ChunkSummary()
+        self.found = 0
+
+    def is_complete(self) -> bool:
+        # The layout is told by the structure, as Minecraft writes the DataVersion after "Level" or the sections.
+        # Until "Level" is found, the fields found are at the root, which means there is no "Level"
+        needed = _NEEDED_IN_LEVEL if self.summary.has_level else _NEEDED_IN_ROOT
+        return self.found & needed == needed
+
+    def skip_list(self, item_id: int, length: int):
+        size = _TAG_SIZES.get(item_id)
+        if size is not None:
+            self.reader.skip(size * length)
+        else:
+            for _ in range(length):
+                self.skip_payload(item_id)
+
+    def skip_payload(self, tag_id: int):
+        reader = self.reader
+        size = _TAG_SIZES.get(tag_id)
+        if size is not None:
+            reader.skip(size)
+        elif tag_id in _ARRAY_ITEM_SIZES:
+            reader.skip(_ARRAY_ITEM_SIZES[tag_id] * reader.unpack(_INT))
+        elif tag_id == TAG_STRING:
+            reader.skip(reader.unpack(_USHORT))
+        elif tag_id == TAG_LIST:
+            item_id = reader.unpack(_UBYTE)
+            self.skip_list(item_id, reader.unpack(_INT))
+        elif tag_id == TAG_COMPOUND:
+            while (item_id := reader.unpack(_UBYTE)) != TAG_END:
+                reader.skip(reader.unpack(_USHORT))
+                self.skip_payload(item_id)
+        else:
+            raise MalformedFileError(f'Unknown tag id {tag_id}')
+
+    def scan_compound(self, is_root: bool) -> bool:
+        """
+        Scans a compound's tags, returns ``True`` as soon as
+        the fields needed for the chunk's layout have been found
+        """
+        reader = self.reader
+        summary = self.summary
+        while (tag_id := reader.unpack(_UBYTE)) != TAG_END:
+            name = reader.read(reader.unpack(_USHORT))
+            if is_root and tag_id == TAG_INT and name == b'DataVersion':
+                summary.data_version = reader.unpack(_INT)
+                continue
+            elif is_root and tag_id == TAG_COMPOUND and name == b'Level':
+                # Before 21w43a, everything but the DataVersion is in "Level"
+                summary.has_level = True
+                if self.scan_compound(False):
+                    return True
+                continue
+            elif tag_id == TAG_LONG and name == b'InhabitedTime':
+                summary.inhabited_time = reader.unpack(_LONG)
+                self.found |= _FOUND_INHABITED_TIME
+            elif tag_id == TAG_STRING and name == b'Status':
+                summary.status = reader.read(reader.unpack(_USHORT)).decode()
+                self.found |= _FOUND_STATUS
+            else:
+                if name == b'Biomes':
+                    summary.has_biomes = True
+                    self.found |= _FOUND_BIOMES
+                self.skip_payload(tag_id)
+            if self.is_complete():
+                return True
+        return False
+
+def quick_scan(data: bytes, compression: int = 2) -> ChunkSummary:
+    """
+    Reads the values of a :class:`ChunkSummary` from a chunk's compressed NBT data,
+    without decoding the rest of the chunk
+
+    The data is only inflated up to the last tag that is needed,
+    which comes before the sections in the chunks written by Minecraft.
+
+    Parameters
+    ----------
+    data
+        Chunk's compressed NBT data, as returned by :meth:`anvil.Region.raw_chunk_bytes`
+    compression
+        Compression type of ``data``
+
+    Raises
+    ------
+    anvil.GZipChunkData
+        If the chunk's compression is gzip
+    nbt.nbt.MalformedFileError
+        If the chunk's data isn't valid NBT, or has no DataVersion
+        while the whole chunk had to be read
+    """
+    if compression == 1:
+        raise GZipChunkData('GZip is not supported')
+    scanner = _Scanner(_Reader(data, compression != 3))
+    reader = scanner.reader
+    if reader.unpack(_UBYTE) != TAG_COMPOUND:
+        raise MalformedFileError('Chunk data is not a compound')
+    reader.skip(reader.unpack(_USHORT))
+    if not scanner.scan_compound(True) and scanner.summary.data_version is None:
+        raise MalformedFileError('Chunk has no DataVersion')
+    return scanner.summary
@@ -0,0 +1,202 @@
+from context import anvil
+from nbt import nbt
+from io import BytesIO
+import random
+import zlib
+import pytest
+
+# quick_scan is checked against the values read from a full parse of the same chunk
+CHUNKS_PER_VERSION = 200
+
+def filler_tags(rng: random.Random) -> list:
+    """Tags that quick_scan has to skip over, including ones named like the tags it looks for"""
+    heightmaps = nbt.TAG_Compound(name='Heightmaps')
+    heightmaps.tags.append(nbt.TAG_Long_Array(name='WORLD_SURFACE'))
+    heightmaps['WORLD_SURFACE'].value = [rng.getrandbits(63) for _ in range(37)]
+    names = nbt.TAG_List(name='PostProcessing', type=nbt.TAG_String)
+    names.tags.extend(nbt.TAG_String(value='x' * rng.randrange(40)) for _ in range(rng.randrange(4)))
+    empty = nbt.TAG_List(name='Entities', type=nbt.TAG_Compound)
+    data = nbt.TAG_Byte_Array(name='Bytes')
+    data.value = bytearray(rng.randrange(256) for _ in range(rng.randrange(64)))
+    return [
+        nbt.TAG_Int(name='xPos', value=rng.randrange(-1000, 1000)),
+        nbt.TAG_Long(name='LastUpdate', value=rng.getrandbits(40)),
+        nbt.TAG_Byte(name='isLightOn', value=1),
+        nbt.TAG_Short(name='Short', value=7),
+        nbt.TAG_Float(name='Float', value=0.5),
+        nbt.TAG_Double(name='Double', value=0.25),
+        data,
+        heightmaps,
+        names,
+        empty,
+    ]
+
+def make_section(rng: random.Random, version: int) -> nbt.TAG_Compound:
+    section = nbt.TAG_Compound()
+    section.tags.append(nbt.TAG_Byte(name='Y', value=rng.randrange(-4, 16)))
+    palette = nbt.TAG_List(name='Palette' if version < anvil.chunk._VERSION_21w43a else 'palette', type=nbt.TAG_Compound)
+    for _ in range(rng.randrange(1, 4)):
+        block = nbt.TAG_Compound()
+        block.tags.append(nbt.TAG_String(name='Name', value='minecraft:stone'))
+        # Decoys, only the chunk's own tags count
+        block.tags.append(nbt.TAG_Long(name='InhabitedTime', value=123456))
+        block.tags.append(nbt.TAG_String(name='Status', value='decoy'))
+        block.tags.append(nbt.TAG_Int(name='DataVersion', value=1))
+        palette.tags.append(block)
+    section.tags.append(palette)
+    return section
+
+def make_chunk(rng: random.Random, version: int) -> nbt.NBTFile:
+    """Makes a chunk of the given version, with its tags shuffled and some of them missing"""
+    root = nbt.NBTFile()
+    root.name = ''
+    before_21w43a = version < anvil.chunk._VERSION_21w43a
+    tags = filler_tags(rng)
+    if rng.random() < 0.8:
+        tags.append(nbt.TAG_Long(name='InhabitedTime', value=rng.choice((0, rng.getrandbits(20)))))
+    if rng.random() < 0.8:
+        tags.append(nbt.TAG_String(name='Status', value=rng.choice(('empty', 'features', 'full', 'minecraft:full'))))
+    if rng.random() < 0.8:
+        sections = nbt.TAG_List(name='Sections' if before_21w43a else 'sections', type=nbt.TAG_Compound)
+        sections.tags.extend(make_section(rng, version) for _ in range(rng.randrange(5)))
+        tags.append(sections)
+    if before_21w43a and rng.random() < 0.5:
+        biomes = nbt.TAG_Int_Array(name='Biomes')
+        biomes.value = [rng.randrange(64) for _ in range(rng.choice((256, 1024)))]
+        tags.append(biomes)
+    rng.shuffle(tags)
+    root_tags = [nbt.TAG_Int(name='DataVersion', value=version)]
+    if before_21w43a:
+        level = nbt.TAG_Compound(name='Level')
+        level.tags.extend(tags)
+        root_tags.append(level)
+    else:
+        root_tags.extend(tags)
+    rng.shuffle(root_tags)
+    root.tags.extend(root_tags)
+    return root
+
+def encode(chunk: nbt.NBTFile) -> bytes:
+    buffer = BytesIO()
+    chunk.write_file(buffer=buffer)
+    return buffer.getvalue()
+
+def assert_matches(summary: anvil.ChunkSummary, chunk: nbt.NBTFile):
+    has_level = 'Level' in chunk
+    level = chunk['Level'] if has_level else chunk
+    assert summary.has_level == has_level
+    # The scan may be over before the DataVersion is reached
+    assert summary.data_version in (None, chunk['DataVersion'].value)
+    assert summary.inhabited_time == (level['InhabitedTime'].value if 'InhabitedTime' in level else 0)
+    # Only the values used by the chunk's layout are always read
+    if has_level:
+        assert summary.has_biomes == ('Biomes' in level)
+    else:
+        assert summary.status == (level['Status'].value if 'Status' in level else None)
+
+@pytest.mark.parametrize('version', [2730, 2844, 2975])
+@pytest.mark.parametrize('compression', [2, 3])
+def test_quick_scan_matches_full_parse(version, compression):
+    rng = random.Random(version * 10 + compression)
+    for _ in range(CHUNKS_PER_VERSION):
+        data = encode(make_chunk(rng, version))
+        if compression == 2:
+            data = zlib.compress(data)
+        summary = anvil.quick_scan(data, compression)
+        chunk = nbt.NBTFile(buffer=BytesIO(zlib.decompress(data) if compression == 2 else data))
+        assert_matches(summary, chunk)
+
+def test_quick_scan_region():
+    rng = random.Random(0)
+    region = anvil.EmptyRegion(0, 0)
+    chunks = {}
+    for index in rng.sample(range(1024), 50):
+        data = encode(make_chunk(rng, rng.choice((2730, 2975))))
+        chunks[index & 31, index >> 5] = data
+        region.add_raw_chunk(index & 31, index >> 5, zlib.compress(data))
+    read = anvil.Region(region.save())
+    seen = 0
+    for x, z, data, compression in read.raw_chunk_iter():
+        assert_matches(anvil.quick_scan(data, compression), nbt.NBTFile(buffer=BytesIO(chunks[x, z])))
+        seen += 1
+    assert seen == len(chunks)
+
+def test_quick_scan_gzip():
+    with pytest.raises(anvil.errors.GZipChunkData):
+        anvil.quick_scan(b'', 1)
+
+def test_quick_scan_no_data_version():
+    chunk = make_chunk(random.Random(1), 2975)
+    del chunk['DataVersion']
+    # Without "Status" the whole chunk is read, so the DataVersion can't be missed
+    if 'Status' in chunk:
+        del chunk['Status']
+    with pytest.raises(nbt.MalformedFileError):
+        anvil.quick_scan(zlib.compress(encode(chunk)))
+
+def test_quick_scan_truncated():
+    rng = random.Random(2)
+    chunk = make_chunk(rng, 2730)
+    # Without "Biomes" the whole "Level" is read, up to where the data ends
+    if 'Biomes' in chunk['Level']:
+        del chunk['Level']['Biomes']
+    data = encode(chunk)
+    with pytest.raises(nbt.MalformedFileError):
+        anvil.quick_scan(zlib.compress(data[:len(data) // 2]))
+
+def test_quick_scan_not_compound():
+    with pytest.raises(nbt.MalformedFileError):
+        anvil.quick_scan(zlib.compress(b'\x03\x00\x00\x00\x00\x00\x01'))
+
+def vanilla_chunk(version: int) -> nbt.NBTFile:
+    """
+    Makes a chunk with its tags in the order Minecraft writes them,
+    which is the iteration order of a Java HashMap
+    """
+    before_21w43a = version < anvil.chunk._VERSION_21w43a
+    rng = random.Random(version)
+    parent = nbt.TAG_Compound(name='Level') if before_21w43a else nbt.NBTFile()
+    parent.tags.append(nbt.TAG_String(name='Status', value='full'))
+    parent.tags.append(nbt.TAG_Int(name='zPos', value=3))
+    parent.tags.append(nbt.TAG_Long(name='LastUpdate', value=1000))
+    if before_21w43a:
+        biomes = nbt.TAG_Int_Array(name='Biomes')
+        biomes.value = [1] * 1024
+        parent.tags.append(biomes)
+    parent.tags.append(nbt.TAG_Long(name='InhabitedTime', value=42))
+    parent.tags.append(nbt.TAG_Int(name='xPos', value=-2))
+    sections = nbt.TAG_List(name='Sections' if before_21w43a else 'sections', type=nbt.TAG_Compound)
+    for _ in range(24):
+        section = make_section(rng, version)
+        states = nbt.TAG_Long_Array(name='data')
+        states.value = [rng.getrandbits(63) for _ in range(256)]
+        section.tags.append(states)
+        sections.tags.append(section)
+    parent.tags.append(sections)
+    parent.tags.append(nbt.TAG_Byte(name='isLightOn', value=1))
+    if before_21w43a:
+        root = nbt.NBTFile()
+        root.tags.append(parent)
+    else:
+        root = parent
+    root.name = ''
+    root.tags.append(nbt.TAG_Int(name='DataVersion', value=version))
+    return root
+
+@pytest.mark.parametrize('version', [2730, 2975])
+def test_quick_scan_stops_before_sections(version):
+    data = encode(vanilla_chunk(version))
+    name = b'Sections' if version < anvil.chunk._VERSION_21w43a else b'sections'
+    start = data.index(bytes([nbt.TAG_LIST]) + len(name).to_bytes(2, 'big') + name)
+    # Only the data before the sections is given, the scan fails if it goes any further
+    head = zlib.compressobj()
+    compressed = head.compress(data[:start]) + head.flush(zlib.Z_SYNC_FLUSH)
+    for summary in (anvil.quick_scan(compressed), anvil.quick_scan(data[:start], 3)):
+        assert summary.has_level == (version < anvil.chunk._VERSION_21w43a)
+        assert summary.data_version is None
+        assert summary.inhabited_time == 42
+        if summary.has_level:
+            assert summary.has_biomes
+        else:
+            assert summary.status == 'full'
+    assert_matches(anvil.quick_scan(zlib.compress(data)), nbt.NBTFile(buffer=BytesIO(data)))
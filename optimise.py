@@ -10,32 +10,40 @@ Examples
 >>> python optimise.py -nokeep
 """
 import importlib.util
+import os
+import re
+from functools import partial
 from importlib.machinery import ModuleSpec
+from multiprocessing import current_process
+from struct import error as StructError
 from sys import modules
 from types import ModuleType
+from zlib import error as ZlibError
 
-from nbt.nbt import NBTFile
+from nbt.nbt import MalformedFileError, NBTFile
 
 # This funky thing right there is apparently the python mantra "There is one obvious wayto do it"s way to import a module from its path.
-# It imports anvil from  "./libs/anvilparser/anvil".
-spec : ModuleSpec = importlib.util.spec_from_file_location("anvil", "./libs/anvilparser/anvil/__init__.py")  # type: ignore
+# It imports anvil from  "./libs/anvilparser/anvil", relative to this file so that it doesn't depend on the working directory.
+# This runs at import time, so the processes of the pool import it the same way when they are spawned.
+spec : ModuleSpec = importlib.util.spec_from_file_location("anvil", os.path.join(os.path.dirname(os.path.abspath(__file__)), "libs", "anvilparser", "anvil", "__init__.py"))  # type: ignore
 anvil : ModuleType = importlib.util.module_from_spec(spec)
 modules["anvil"] = anvil
 spec.loader.exec_module(anvil)  # type: ignore
 
-_VERSION_21w43a = 2844  # Version where "Level" was removed from chunk
+_CACHED_TAGS = ("Heightmaps", "isLightOn")  # Tags that optimise_chunk deletes, as Minecraft calculates them again
+_MCA_RE = re.compile(r'r\.(-?\d+)\.(-?\d+)\.mca\Z')  # Region file name, with the region coordinates as groups
 
 
-def get_chunk_version(chunk: NBTFile) -> int:
+def get_chunk_version(chunk: anvil.ChunkSummary) -> int:
     """
     Used to know the chunk version.
 
-    This function uses the chunk's "DataVersion" value.
+    This function uses the chunk's layout, as "Level" was removed in 21w43a (1.18).
 
     Parameters
     ----------
-    chunk : NBTFile
-        Chunk to check the version from.
+    chunk : anvil.ChunkSummary
+        Summary of the chunk to check the version from.
 
     Returns
     -------
@@ -43,14 +51,14 @@ def get_chunk_version(chunk: NBTFile) -> int:
         * 0 For version from 1.17 and prior
         * 1 For version from 1.18 and up.
     """
-    if chunk["DataVersion"].value < _VERSION_21w43a:
+    if chunk.has_level:
         return 0  # 1.17-
     return 1  # 1.18+
 
 
-def is_chunk_useless(chunk: NBTFile, chunk_version : int) -> (bool|None):
+def is_chunk_useful(chunk: anvil.ChunkSummary) -> bool:
     """
-    This function simply checks if a chunk is useless using a few known critters:
+    This function simply checks if a chunk is useful using a few known critters:
     
     1.17:
     * Has "Biomes" been generated? If not, this means the chunk hasn't been populated yet.
@@ -59,88 +67,72 @@ def is_chunk_useless(chunk: NBTFile, chunk_version : int) -> (bool|None):
     1.18:
     * Has the chunk "Status" been set to full? If not, this means the chunk hasn't been populated yet.
     * Does the chunk have an "InhabitedTime" over 0? If not, this means the chunk has never been loaded by a player.
+
+    The chunk's layout is checked along the way, so that this is a single call per chunk.
     
     Parameters
     ----------
-    chunk : NBTFile
-        Chunk to verify.
-    chunk_version : int
-        Chunk version (See get_chunk_version)
+    chunk : anvil.ChunkSummary
+        Summary of the chunk to verify (See anvil.quick_scan)
 
     Returns
     -------
     bool
         True if the chunk is useful, false otherwise.
-    None
-        An unknown chunk version was passed
-
-    See Also
-    --------
-    get_chunk_version : Obtain the chunk version
     """
-    return (
+    if chunk.has_level:
         # 1.17 checks
-        chunk_version == 0
-        # Chunk has been loaded
-        and "Biomes" in chunk["Level"]
-        # Chunk has been visited
-        and chunk["Level"]["InhabitedTime"].value > 0
-    ) or (
-        chunk_version == 1
-        # 1.18 checks
-        # Minecraft thinks the chunk has been fully populated/loaded
-        and chunk["Status"].value == "full"
-        # Chunk has been visited/loaded by a player
-        and chunk["InhabitedTime"].value > 0
-    ) or None
-def optimise_chunk(chunk: NBTFile, chunk_version: int) -> NBTFile:
+        # Chunk has been loaded, and visited
+        return chunk.has_biomes and chunk.inhabited_time > 0
+    # 1.18 checks
+    # Minecraft thinks the chunk has been fully populated/loaded, and it has been visited/loaded by a player
+    return chunk.status == "full" and chunk.inhabited_time > 0
+
+
+def optimise_chunk(chunk: NBTFile, chunk_version: int) -> bool:
     """
-    Optimise singular chunks.
+    Optimise singular chunks, in place.
 
     This is accomplished by deleting pre-calculated/cached data.
 
     Parameters
     ----------
     chunk : NBTFile
-        Chunk to verify.
+        Chunk to optimise.
     chunk_version : int
         Chunk version (see get_chunk_version)
 
     Returns
     -------
-    NBTFile
-        Optimised chunk.
+    bool
+        True if the chunk has been modified, false if there was nothing to delete.
 
     See Also
     --------
     optimise_region: Optimise an entire region file.
     """
-    match chunk_version:
-        case 0:  # 1.17-
-            if "Heightmaps" in chunk["Level"]:
-                del chunk["Level"]["Heightmaps"]
-            if "isLightOn" in chunk["Level"]:
-                del chunk["Level"]["isLightOn"]
-        case 1:  # 1.18+
-            if "Heightmaps" in chunk:
-                del chunk["Heightmaps"]
-            if "isLightOn" in chunk:
-                del chunk["isLightOn"]
-    return chunk
-
-
-def optimise_region(region_x: str, region_z: str, directory: str, optimisechunks: bool) -> (None|anvil.EmptyRegion):
+    # Before 1.18 the data is inside of "Level"
+    parent = chunk["Level"] if chunk_version == 0 else chunk
+    # Compounds look their tags up one by one, so they are all filtered out in one pass
+    tags = [tag for tag in parent.tags if tag.name not in _CACHED_TAGS]
+    if len(tags) == len(parent.tags):
+        return False
+    parent.tags = tags
+    return True
+
+
+def optimise_region(region_x: int, region_z: int, path: str, optimisechunks: bool) -> (None|anvil.EmptyRegion):
     """
-    Used to filter out useless chunks from a region file, given its X and Y position, and its directory.
+    Used to filter out useless chunks from a region file, given its X and Z position, and its path.
 
     Parameters
     ----------
-    region_x : str
+    region_x : int
         The region's X position.
-    regionY : str
-        The region's Y position.
-    directory : str
-        The region file's directory.
+    region_z : int
+        The region's Z position.
+    path : str
+        The region file's path.
     optimisechunks : bool
         Also optimise singular chunks or not?
 
@@ -153,40 +145,104 @@ def optimise_region(region_x: str, region_z: str, directory: str, optimisechunks
 
     Examples
     --------
-    >>> optimise_region("-1","0","./world/region_coords_list/",True)
+    >>> optimise_region(-1, 0, "./world/region/r.-1.0.mca", True)
     anvil.EmptyRegion object
 
     See Also
     --------
     optimise_chunk: Optimize a singular chunk.
     """
-    region : anvil.Region = anvil.Region.from_file(f"{directory}r.{region_x}.{region_z}.mca")
-    new_region : anvil.EmptyRegion = anvil.EmptyRegion(int(region_x), int(region_z))
+    new_region : anvil.EmptyRegion = anvil.EmptyRegion(region_x, region_z)
     is_region_populated : bool = False
+    # Bound once rather than looked up for every chunk
+    quick_scan = anvil.quick_scan
+    add_raw_chunk = new_region.add_raw_chunk
     
-    for chunk_x in range(0, 32):
-        for chunk_z in range(0, 32):
-            chunk : NBTFile = region.chunk_data(chunk_x, chunk_z)
-            if chunk:  # If a chunk exists at those chunk coordinate
-                chunk_version : int = get_chunk_version(chunk)  # Get its version
-                if optimisechunks:
-                    chunk = optimise_chunk(chunk, chunk_version)
-                if is_chunk_useless(chunk, chunk_version): 
+    # The file is memory-mapped, and unmapped as soon as the chunks have been extracted
+    with anvil.Region.from_file(path) as region:
+        # The header is unpacked once, for both the check and the iteration
+        locations = region.locations()
+        # Nothing has ever been generated in this region
+        if not any(locations):
+            return None
+        # Only the chunks that exist in the region are visited
+        for chunk_x, chunk_z, data, compression in region.raw_chunk_iter(locations):
+            # Only the few tags needed by the checks are read, the chunk is fully parsed only if it has to be modified
+            summary : anvil.ChunkSummary = quick_scan(data, compression)
+            if not is_chunk_useful(summary):
+                continue
+            is_region_populated = True
+            if optimisechunks:
+                chunk : NBTFile = region.chunk_data(chunk_x, chunk_z)  # type: ignore
+                if optimise_chunk(chunk, get_chunk_version(summary)):
+                    # The chunk has been modified, so it has to be encoded again
                     new_region.add_chunk(anvil.Chunk(chunk))  # type: ignore
-                    is_region_populated = True
+                    continue
+            # Copy the chunk as it is stored, without encoding and compressing it again
+            add_raw_chunk(chunk_x, chunk_z, data, compression)
                     
     return new_region if is_region_populated else None
 
 
+def prefetch(path: str) -> None:
+    """
+    Asks the OS to start reading a file into its cache, so that it is already there when a worker opens it.
+
+    This is only a hint, it returns without waiting for the file to be read.
+    It needs os.posix_fadvise, which isn't available on every platform (e.g. Windows).
+
+    Parameters
+    ----------
+    path : str
+        Path to the file to read.
+    """
+    # The file is only open for the duration of the call, so a worker can still remove or replace it
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def worker(region_file: tuple, settings: dict) -> None:
+    """
+    Worker used for multiprocessing the I/O and optimising tasks.
+
+    It lives at module scope so that it can be pickled and sent to the processes of the pool.
+
+    Parameters
+    ----------
+    region_file : tuple
+        The region's X and Z position, as integers, and the path to its file.
+    settings : dict
+        The parsed command line arguments.
+    """
+    worker_name = current_process().name
+    region_x, region_z, path = region_file
+    filename = os.path.basename(path)
+    print(f"{worker_name}: Starting work on {filename}!")
+    try:
+        region = optimise_region(region_x, region_z, path, settings["optimisechunks"])
+        if region:
+            print(f"{worker_name}: {filename} has been cleaned! Saving..")
+            # Saved next to its destination then moved over it, so an interrupted save never leaves a half-written region.
+            # With --nokeep the destination is the input file, which gets replaced in the same step.
+            temporary_path = settings["output"] + filename + ".tmp"
+            region.save(temporary_path)
+            os.replace(temporary_path, settings["output"] + filename)
+        else:
+            print(f"{worker_name}: Removing file '{filename}' as it contains nothing but empty chunks.")
+            if settings["replace"]:
+                os.remove(path)
+    except (IndexError, MalformedFileError, RecursionError, StructError, UnicodeDecodeError, ZlibError, anvil.compression.zlib.error, anvil.errors.GZipChunkData): # Errors that may occur if a file contains corrupted or unreadable data
+        print(f"{worker_name}: Error while processing {filename}!")
+        os.replace(path, settings["output"] + filename)
+
+
 if __name__ == "__main__":
     from argparse import ArgumentParser
-    from multiprocessing import Process, cpu_count
-    import os
-    from re import findall as re_findall
-    from multiprocessing.pool import ThreadPool as Pool
-    from zlib import error as ZlibError
-
-    from nbt.nbt import MalformedFileError
+    from concurrent.futures import ThreadPoolExecutor
+    from multiprocessing import Pool, cpu_count
 
     def is_directory(string: str) -> str:
         """
@@ -207,13 +263,37 @@ if __name__ == "__main__":
         NotADirectoryError
             An invalid path was supplied.
         """
-        # Ensure its a directory
-        if not string.endswith("/") or not string.endswith("\\"):
-            string += "/"
+        # Ensure it ends with a separator, as file names are appended to it
+        if not string.endswith(("/", "\\")):
+            string += os.sep
         if os.path.isdir(string):
             return string
         raise NotADirectoryError(f"'{string}' is not a valid directory!")
 
+    def is_positive_integer(string: str) -> int:
+        """
+        Verifies that the given string is a positive integer.
+
+        Parameters
+        ----------
+        string: str
+            Integer as string.
+
+        Returns
+        -------
+        int
+            The validated integer.
+
+        Raises
+        -------
+        ValueError
+            The string isn't a positive integer.
+        """
+        number = int(string)
+        if number > 0:
+            return number
+        raise ValueError(f"'{string}' is not a positive integer!")
+
     parser = ArgumentParser(description="Optimise your minecraft region folder to save storage.")
 
     parser.add_argument(
@@ -247,40 +327,62 @@ if __name__ == "__main__":
         default = False
     )
 
+    parser.add_argument(
+        "-w", "--workers",
+        type = is_positive_integer,
+        help = "How many regions are processed at the same time (Default: $UCB_WORKERS, or your CPU count)",
+        default = os.environ.get("UCB_WORKERS", cpu_count())
+    )
+    parser.add_argument(
+        "-iow", "--ioworkers",
+        type = is_positive_integer,
+        help = "How many region files are hinted to be read ahead at the same time, lower it for hard drives and raise it for SSDs (Default: $UCB_IO, or 4 at most)",
+        default = os.environ.get("UCB_IO")
+    )
+
+    parser.add_argument(
+        "-cs", "--chunksize",
+        type = is_positive_integer,
+        help = "How many regions are handed out to a worker at once, regions are processed from the largest to the smallest so batches work against it (Default: 1)",
+        default = 1
+    )
+
     settings = vars(parser.parse_args())
 
+    if settings["ioworkers"] is None:
+        settings["ioworkers"] = min(4, settings["workers"])
+
     if settings["nokeep"]:
         settings["nokeep"] = True
         settings["replace"] = True
         settings["output"] = settings["input"]
 
-    def worker(region_coords: tuple) -> None:
-        """Worker used for multiprocessing the I/O and optimising tasks"""
-        worker_name = Process().name
-        filename = f"r.{region_coords[0]}.{region_coords[1]}.mca"
-        print(f"{worker_name}: Starting work on {filename}!")
-        try:
-            region = optimise_region(region_coords[0], region_coords[1], settings["input"], settings["optimisechunks"])
-            if region:
-                print(f"{worker_name}: {filename} has been cleaned! Saving..")
-                if settings["nokeep"]:
-                    os.remove(settings["input"]+filename)
-                region.save(settings["output"]+filename)
-            else:
-                print(f"{worker_name}: Removing file '{filename}' as it contains nothing but empty chunks.")
-                if settings["replace"]:
-                    os.remove(settings["input"]+filename)
-        except (IndexError, MalformedFileError, UnicodeDecodeError, ZlibError): # Errors that may occur if a file contains corrupted or unreadable data
-            print(f"{worker_name}: Error while processing {filename}!")
-            os.rename(settings["input"] + filename, settings["output"] + filename)
-
-    with Pool(cpu_count()) as pool:
-        region_coords_list = [region_coords
-                                for item in os.scandir(settings["input"])
-                                    if item.path.endswith(".mca")
-                                        and item.is_file()
-                                        and (region_coords := re_findall(r'r\.(-?\d+)\.(-?\d+)\.mca', item.name)[0]) # Extract the region coordinates from the file name
-                            ]
-        pool.map(worker, region_coords_list)
+    with os.scandir(settings["input"]) as entries:
+        # The path is kept along with the coordinates, so that the workers don't have to build it again
+        region_entries = [(item, (int(match.group(1)), int(match.group(2)), item.path))
+                            for item in entries
+                                if item.name.endswith(".mca")
+                                    and (match := _MCA_RE.match(item.name)) # Extract the region coordinates from the file name
+                                    and item.is_file() # Checked last, as it may need to stat the file
+                          ]
+    # Largest files first, so that the longest regions to process don't start last while the other workers sit idle
+    region_entries.sort(key=lambda region_entry: region_entry[0].stat().st_size, reverse=True)
+    region_files = [region_file for _, region_file in region_entries]
+
+    # How many regions ahead of the workers their files are read, as many as can be handed out before the workers are done with them.
+    # Reading further ahead would push files out of the OS's cache before they get used.
+    read_ahead = 2 * settings["workers"] * settings["chunksize"]
+    can_prefetch = hasattr(os, "posix_fadvise")
+
+    with Pool(settings["workers"]) as pool, ThreadPoolExecutor(max_workers=settings["ioworkers"]) as prefetcher:
+        # A region that can't be prefetched, e.g. as it has already been removed, is just read by its worker, so the futures aren't checked
+        if can_prefetch:
+            for region_file in region_files[:read_ahead]:
+                prefetcher.submit(prefetch, region_file[2])
+        # Regions are handed out one by one and in completion order, so that a slow region doesn't hold back the others.
+        # The prefetching is driven from here rather than from the pool's own threads, so an error in a worker ends the run straight away.
+        for done, _ in enumerate(pool.imap_unordered(partial(worker, settings=settings), region_files, chunksize=settings["chunksize"]), read_ahead):
+            if can_prefetch and done < len(region_files):
+                prefetcher.submit(prefetch, region_files[done][2])
 
     print("Done!")